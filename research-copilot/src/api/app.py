@@ -1,24 +1,173 @@
 # src/api/app.py
 from __future__ import annotations
 
-import hashlib
+import os
+import tempfile
+from pathlib import Path
+from typing import BinaryIO, Tuple
+
+import xxhash
 from fastapi import FastAPI, UploadFile, File, HTTPException
-import json
+import orjson
 from collections import Counter
+from cachetools import TTLCache
 from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
 from src.vector_store import reset_collection
-from src.config import UPLOADS_DIR, TOP_K
-from src.vector_store import get_collection, add_chunks, query
-from src.qa_ollama import answer as grounded_answer, answer_stream
-from src.ingest import pdf_to_chunks, text_to_chunks
+from src.config import UPLOADS_DIR, UPLOAD_CHUNK_SIZE, TOP_K, QUERY_BATCH_WINDOW
+from src.vector_store import get_collection, add_chunks, query, known_doc_ids, count_source_chunks
+from src.qa_ollama import answer as grounded_answer, answer_stream, aclose_ollama
+from src.ingest import pdf_to_chunks, text_to_chunks, shutdown_extractor
+from src.query_batcher import QueryEmbeddingBatcher
 from src.api.schemas import AskRequest, AskResponse, IngestTextRequest, IngestTextResponse
 
 
 app = FastAPI(title="Research Copilot API", version="0.3.0")
 
+# Answers keyed on (endpoint, question, k, history, corpus_version); see _answer_key
+_ANSWER_CACHE = TTLCache(maxsize=512, ttl=600)
+
+_QUERY_BATCHER = QueryEmbeddingBatcher(window=QUERY_BATCH_WINDOW)
+
+
 @app.on_event("startup")
 def _startup():
     UPLOADS_DIR.mkdir(parents=True, exist_ok=True)
+    app.state.corpus_version = 0
+
+    # One full metadata scan at startup; afterwards both are maintained incrementally
+    _, collection = get_collection()
+    data = collection.get(include=["metadatas"])
+    metas = [m for m in (data.get("metadatas", []) or []) if isinstance(m, dict)]
+
+    # Content hashes already in the vector DB, so identical re-uploads skip re-embedding
+    app.state.known_ids = {m["doc_id"] for m in metas if m.get("doc_id")}
+    # Chunk counts per source for GET /documents
+    app.state.source_counts = Counter(m.get("source", "unknown") for m in metas)
+
+
+@app.on_event("startup")
+async def _start_query_batcher():
+    _QUERY_BATCHER.start()
+
+
+@app.on_event("shutdown")
+async def _stop_query_batcher():
+    await _QUERY_BATCHER.stop()
+
+
+@app.on_event("shutdown")
+async def _close_ollama():
+    await aclose_ollama()
+
+
+@app.on_event("shutdown")
+def _stop_extractor():
+    shutdown_extractor()
+
+
+def _corpus_changed():
+    # Any ingest/delete/reset can change retrieval results, so old cached answers stop matching
+    app.state.corpus_version += 1
+
+
+def _answer_key(endpoint: str, question: str, k: int, req: AskRequest):
+    history = tuple((m.role, m.content) for m in (req.chat_history or []))
+    return (endpoint, " ".join(question.lower().split()), k, history, app.state.corpus_version)
+
+
+def _query_collection(question: str, k: int, emb):
+    # Chroma is blocking; callers run this in the threadpool
+    _, collection = get_collection()
+    return query(collection, question, k=k, query_embeddings=[emb])
+
+
+async def _retrieve(question: str, k: int):
+    emb = await _QUERY_BATCHER.embed(question)
+    return await run_in_threadpool(_query_collection, question, k, emb)
+
+
+def _is_indexed(collection, doc_id: str) -> bool:
+    # known_ids is a startup snapshot plus this process's own updates; something else
+    # (e.g. the dev scripts' reset_collection) may have removed the content since
+    return bool(collection.get(where={"doc_id": doc_id}, limit=1, include=[])["ids"])
+
+
+def _drop_source(collection, source_name: str):
+    """Remove every chunk stored for `source_name` (blocking; callers off the event loop)."""
+    # Forget the content hashes first so the same bytes can be ingested again
+    app.state.known_ids -= known_doc_ids(collection, where={"source": source_name})
+
+    # Chroma supports where filters on metadata
+    collection.delete(where={"source": source_name})
+    app.state.source_counts.pop(source_name, None)
+
+
+def _replace_source(collection, chunks, source_name: str, doc_id: str, keep_other_docs: bool = False) -> int:
+    """
+    Add `chunks` as `doc_id` under `source_name`, then drop the source's chunks they supersede
+    (blocking; callers off the event loop). Returns the number of chunks added.
+    Add first, remove after: if extraction, embedding or the insert fails or yields nothing,
+    the chunks already stored for the source stay and only partially inserted new ones are removed.
+    """
+    before = set(collection.get(where={"source": source_name}, include=[])["ids"])
+    n_added = 0
+    try:
+        n_added = add_chunks(collection, chunks, source_name=source_name, doc_id=doc_id)
+    finally:
+        if not n_added:
+            partial = collection.get(where={"$and": [{"source": source_name}, {"doc_id": doc_id}]}, include=[])["ids"]
+            new_only = [i for i in partial if i not in before]
+            if new_only:
+                collection.delete(ids=new_only)
+    if not n_added:
+        return 0
+
+    # Superseded: chunks from before doc_ids existed (older id schemes, no doc_id) always,
+    # chunks of other uploads unless the source keeps several
+    data = collection.get(where={"source": source_name}, include=["metadatas"])
+    stale_ids, stale_docs = [], set()
+    for _id, meta in zip(data["ids"], data.get("metadatas") or []):
+        other = (meta or {}).get("doc_id")
+        if other == doc_id or (other and keep_other_docs):
+            continue
+        stale_ids.append(_id)
+        if other:
+            stale_docs.add(other)
+    if stale_ids:
+        collection.delete(ids=stale_ids)
+    app.state.known_ids -= stale_docs
+    return n_added
+
+
+def _save_upload(src: BinaryIO, dest: Path) -> Tuple[str, int]:
+    """
+    Copy an upload to disk in UPLOAD_CHUNK_SIZE steps, hashing as it goes.
+    Writes go straight to the fd (no Python-level write buffer on top of the read buffer).
+    The copy lands in a temp file next to `dest` and only replaces it once a non-empty
+    copy has finished, so an empty or interrupted upload never touches an existing file.
+    Returns (xxh3 hex digest, size in bytes).
+    """
+    hasher = xxhash.xxh3_64()
+    size = 0
+    fd, tmp_path = tempfile.mkstemp(dir=dest.parent, prefix=f".{dest.name}.", suffix=".part")
+    try:
+        os.chmod(tmp_path, 0o644)  # mkstemp creates 0600; keep the permissions uploads always had
+        try:
+            while chunk := src.read(UPLOAD_CHUNK_SIZE):
+                hasher.update(chunk)
+                size += len(chunk)
+                view = memoryview(chunk)
+                while view:
+                    view = view[os.write(fd, view):]
+        finally:
+            os.close(fd)
+        if size:
+            os.replace(tmp_path, dest)
+    finally:
+        # Already gone after a successful replace; otherwise drop the partial copy
+        Path(tmp_path).unlink(missing_ok=True)
+    return hasher.hexdigest(), size
 
 
 @app.get("/health")
@@ -31,28 +180,44 @@ async def ingest_pdf(file: UploadFile = File(...)):
     if not file.filename.lower().endswith(".pdf"):
         raise HTTPException(status_code=400, detail="Please upload a PDF file.")
 
-    # Save upload
-    raw = await file.read()
-    if not raw:
-        raise HTTPException(status_code=400, detail="Uploaded file is empty.")
-
+    # Save upload + create doc_id (stable-ish per upload content) in one threadpool hop
     save_path = UPLOADS_DIR / file.filename
-    save_path.write_bytes(raw)
-
-    # Create doc_id (stable-ish per upload content)
-    doc_id = hashlib.sha1(raw).hexdigest()[:12]
+    doc_id, size = await run_in_threadpool(_save_upload, file.file, save_path)
 
-    # Extract + chunk
-    chunks = pdf_to_chunks(save_path)
-    if not chunks:
+    if not size:
+        raise HTTPException(status_code=400, detail="Uploaded file is empty.")
+    _, collection = get_collection()
+    if doc_id in app.state.known_ids:
+        if await run_in_threadpool(_is_indexed, collection, doc_id):
+            return {
+                "message": "dedup_hit",
+                "doc_id": doc_id,
+                "filename": file.filename,
+                "chunks_added": 0,
+                "uploads_path": str(save_path),
+            }
+        app.state.known_ids.discard(doc_id)
+
+    try:
+        # Extract + chunk + store in Chroma, streamed page by page in bounded batches.
+        # The upload replaces what was stored under this filename (the file on disk already was):
+        # chunk ids depend on the id hash and on extraction details, so older chunks would
+        # otherwise stay next to the new ones and come back as duplicate evidence
+        chunks = pdf_to_chunks(save_path)
+        n_added = await run_in_threadpool(_replace_source, collection, chunks, file.filename, doc_id)
+    finally:
+        # Recount rather than add n_added: re-ingested ids overwrite rather than add, and
+        # superseded chunks were just removed
+        app.state.source_counts[file.filename] = await run_in_threadpool(count_source_chunks, collection, file.filename)
+        _corpus_changed()
+
+    if not n_added:
         raise HTTPException(
             status_code=400,
             detail="No extractable text found. (Scanned PDFs need OCR; we can add later.)",
         )
 
-    # Store in Chroma
-    _, collection = get_collection()
-    n_added = add_chunks(collection, chunks, source_name=file.filename)
+    app.state.known_ids.add(doc_id)
 
     return {
         "message": "ingested",
@@ -64,7 +229,7 @@ async def ingest_pdf(file: UploadFile = File(...)):
 
 
 @app.post("/ask", response_model=AskResponse)
-def ask(req: AskRequest):
+async def ask(req: AskRequest):
     q = (req.question or "").strip()
     if not q:
         raise HTTPException(status_code=400, detail="Question cannot be empty.")
@@ -72,34 +237,25 @@ def ask(req: AskRequest):
     k = req.top_k if req.top_k is not None else TOP_K
     k = max(1, min(int(k), 20))  # safety cap
 
-    _, collection = get_collection()
-    hits = query(collection, q, k=k)
+    key = _answer_key("ask", q, k, req)
+    cached = _ANSWER_CACHE.get(key)
+    if cached is not None:
+        return cached
+
+    hits = await _retrieve(q, k)
 
     if not hits:
         return AskResponse(answer="INSUFFICIENT_EVIDENCE: No relevant chunks retrieved.", sources=[])
 
-    # Call Ollama with strict citations
-    history = [m.model_dump() for m in (req.chat_history or [])]
-    ans = grounded_answer(q, hits, chat_history=history)
-
-    # Return sources for UI
-    sources = []
-    for h in hits:
-        meta = h["meta"] or {}
-        txt = h["text"] or ""
-        sources.append(
-            {
-                "source": str(meta.get("source", "unknown")),
-                "page": int(meta.get("page", 0) or 0),
-                "distance": float(h.get("distance", 0.0)),
-                "chunk_id": h.get("id"),
-                "start": meta.get("start"),
-                "end": meta.get("end"),
-                "chunk_preview": (txt[:240] + ("..." if len(txt) > 240 else "")),
-            }
-        )
+    # Call Ollama with strict citations (build_prompt reads the ChatMessage models directly)
+    ans = await grounded_answer(q, hits, chat_history=req.chat_history)
 
-    return AskResponse(answer=ans, sources=sources)
+    # Return sources for UI (summaries are precomputed by query())
+    sources = [h["summary"] for h in hits]
+
+    resp = AskResponse(answer=ans, sources=sources)
+    _ANSWER_CACHE[key] = resp
+    return resp
 
 
 
@@ -110,15 +266,32 @@ def ingest_text(req: IngestTextRequest):
         raise HTTPException(status_code=400, detail="Text cannot be empty.")
 
     # doc_id based on content (stable-ish)
-    doc_id = hashlib.sha1(raw_text.encode("utf-8")).hexdigest()[:12]
+    doc_id = xxhash.xxh3_64_hexdigest(raw_text.encode("utf-8"))
     source_name = (req.source_name or "pasted_text").strip() or "pasted_text"
-
-    chunks = text_to_chunks(raw_text, source_name=source_name)
-    if not chunks:
+    _, collection = get_collection()
+    if doc_id in app.state.known_ids:
+        if _is_indexed(collection, doc_id):
+            return IngestTextResponse(
+                message="dedup_hit",
+                doc_id=doc_id,
+                source_name=source_name,
+                chunks_added=0,
+            )
+        app.state.known_ids.discard(doc_id)
+
+    try:
+        # Pastes under one source name accumulate (e.g. the UI's default "pasted_text");
+        # only that source's legacy chunks without a doc_id are superseded (see _replace_source)
+        chunks = text_to_chunks(raw_text, source_name=source_name)
+        n_added = _replace_source(collection, chunks, source_name, doc_id, keep_other_docs=True)
+    finally:
+        app.state.source_counts[source_name] = count_source_chunks(collection, source_name)
+        _corpus_changed()
+
+    if not n_added:
         raise HTTPException(status_code=400, detail="Text produced no chunks.")
 
-    _, collection = get_collection()
-    n_added = add_chunks(collection, chunks, source_name=source_name)
+    app.state.known_ids.add(doc_id)
 
     return IngestTextResponse(
         message="ingested",
@@ -131,7 +304,7 @@ def ingest_text(req: IngestTextRequest):
 
 
 @app.post("/ask/stream")
-def ask_stream(req: AskRequest):
+async def ask_stream(req: AskRequest):
     q = (req.question or "").strip()
     if not q:
         raise HTTPException(status_code=400, detail="Question cannot be empty.")
@@ -139,57 +312,53 @@ def ask_stream(req: AskRequest):
     k = req.top_k if req.top_k is not None else TOP_K
     k = max(1, min(int(k), 20))
 
-    _, collection = get_collection()
-    hits = query(collection, q, k=k)
-
-    # Build sources payload once (same as /ask, plus optional chunk_id/start/end)
-    sources_payload = []
-    for h in hits:
-        meta = h.get("meta") or {}
-        txt = h.get("text") or ""
-        sources_payload.append(
-            {
-                "source": str(meta.get("source", "unknown")),
-                "page": int(meta.get("page", 0) or 0),
-                "distance": float(h.get("distance", 0.0)),
-                "chunk_id": h.get("id"),
-                "start": meta.get("start"),
-                "end": meta.get("end"),
-                "chunk_preview": (txt[:240] + ("..." if len(txt) > 240 else "")),
-            }
-        )
+    key = _answer_key("stream", q, k, req)
+    cached = _ANSWER_CACHE.get(key)
+    if cached is not None:
+        tokens, sources_payload = cached
+
+        async def replay():
+            for tok in tokens:
+                yield orjson.dumps({"type": "token", "data": tok}) + b"\n"
+            yield orjson.dumps({"type": "sources", "data": sources_payload}) + b"\n"
+            yield orjson.dumps({"type": "done"}) + b"\n"
 
-    def gen():
+        return StreamingResponse(replay(), media_type="application/x-ndjson")
+
+    hits = await _retrieve(q, k)
+
+    # Sources payload (same as /ask, summaries are precomputed by query())
+    sources_payload = [h["summary"] for h in hits]
+
+    async def gen():
         if not hits:
-            yield json.dumps({"type": "token", "data": "INSUFFICIENT_EVIDENCE: No relevant chunks retrieved."}) + "\n"
-            yield json.dumps({"type": "sources", "data": []}) + "\n"
-            yield json.dumps({"type": "done"}) + "\n"
+            yield orjson.dumps({"type": "token", "data": "INSUFFICIENT_EVIDENCE: No relevant chunks retrieved."}) + b"\n"
+            yield orjson.dumps({"type": "sources", "data": []}) + b"\n"
+            yield orjson.dumps({"type": "done"}) + b"\n"
             return
 
         # stream tokens
-        history = [m.model_dump() for m in (req.chat_history or [])]
-        for tok in answer_stream(q, hits, chat_history=history):
-            yield json.dumps({"type": "token", "data": tok}) + "\n"
+        tokens = []
+        async for tok in answer_stream(q, hits, chat_history=req.chat_history):
+            tokens.append(tok)
+            yield orjson.dumps({"type": "token", "data": tok}) + b"\n"
+
+        # only complete streams are replayable
+        _ANSWER_CACHE[key] = (tokens, sources_payload)
 
         # send sources at end
-        yield json.dumps({"type": "sources", "data": sources_payload}) + "\n"
-        yield json.dumps({"type": "done"}) + "\n"
+        yield orjson.dumps({"type": "sources", "data": sources_payload}) + b"\n"
+        yield orjson.dumps({"type": "done"}) + b"\n"
 
     return StreamingResponse(gen(), media_type="application/x-ndjson")
 
 
 @app.get("/documents")
 def list_documents():
-    _, collection = get_collection()
-
-    # Get all metadatas (may be large; okay for now)
-    data = collection.get(include=["metadatas"])
-    metas = data.get("metadatas", []) or []
-
-    sources = [m.get("source", "unknown") for m in metas if isinstance(m, dict)]
-    counts = Counter(sources)
+    # Served from the in-memory counts kept up to date by ingest/delete/reset
+    counts = app.state.source_counts
 
-    docs = [{"source": s, "chunks": int(c)} for s, c in sorted(counts.items())]
+    docs = [{"source": s, "chunks": int(c)} for s, c in sorted(counts.items()) if c > 0]
     return {"documents": docs, "total_sources": len(docs)}
 
 
@@ -200,9 +369,8 @@ def delete_document(source_name: str):
         raise HTTPException(status_code=400, detail="source_name cannot be empty")
 
     _, collection = get_collection()
-
-    # Chroma supports where filters on metadata
-    collection.delete(where={"source": source_name})
+    _drop_source(collection, source_name)
+    _corpus_changed()
 
     return {"message": "deleted", "source": source_name}
 
@@ -210,4 +378,7 @@ def delete_document(source_name: str):
 @app.post("/documents/reset")
 def reset_documents():
     reset_collection()
+    app.state.known_ids.clear()
+    app.state.source_counts.clear()
+    _corpus_changed()
     return {"message": "reset_done"}
\ No newline at end of file
@@ -2,7 +2,7 @@
 from __future__ import annotations
 
 from typing import Optional, List, Literal
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict
 
 
 class ChatMessage(BaseModel):
@@ -11,6 +11,8 @@ class ChatMessage(BaseModel):
 
 
 class AskRequest(BaseModel):
+    model_config = ConfigDict(extra="forbid", frozen=True)
+
     question: str
     top_k: Optional[int] = None
     chat_history: List[ChatMessage] = []
@@ -32,6 +34,8 @@ class AskResponse(BaseModel):
 
 
 class IngestTextRequest(BaseModel):
+    model_config = ConfigDict(extra="forbid", frozen=True)
+
     text: str
     source_name: Optional[str] = "pasted_text"
 
@@ -1,40 +1,37 @@
-from typing import List, Dict
+from typing import List, Dict, Iterable, Iterator, Tuple
+
+import numpy as np
+
 from src.config import CHUNK_SIZE, CHUNK_OVERLAP
 
 
-def chunk_pages(pages: List[Dict], chunk_size: int = CHUNK_SIZE, overlap: int = CHUNK_OVERLAP):
+def _chunk_offsets(n: int, chunk_size: int, overlap: int) -> Tuple[List[int], List[int]]:
+    """
+    (starts, ends) of the overlapping windows over a text of length n, computed in numpy.
+    Window starts stop once the previous window already reached the end.
+    """
+    starts = np.arange(0, max(n - overlap, 1), chunk_size - overlap, dtype=np.int64)
+    ends = np.minimum(starts + chunk_size, n)
+    # Plain ints: Chroma metadata does not accept numpy scalars
+    return starts.tolist(), ends.tolist()
+
+
+def chunk_pages(pages: Iterable[Dict], chunk_size: int = CHUNK_SIZE, overlap: int = CHUNK_OVERLAP) -> Iterator[Dict]:
     """
     Chunk each page into overlapping character windows.
     Keeps page number so we can cite sources later.
+    Page text is expected to be whitespace-normalized already (see ingest.py).
+    Lazy: pages are consumed and chunks yielded one page at a time.
     """
-    chunks = []
-
     for p in pages:
         page_num = p["page"]
         text = p["text"]
         if not text:
             continue
 
-        start = 0
-        while start < len(text):
-            end = min(start + chunk_size, len(text))
-            chunk = text[start:end].strip()
-
+        starts, ends = _chunk_offsets(len(text), chunk_size, overlap)
+        for s, e in zip(starts, ends):
+            # Windows cut mid-text can still start/end on a space; offsets stay the raw window's
+            chunk = text[s:e].strip()
             if chunk:
-                chunks.append(
-                    {
-                        "text": chunk,
-                        "meta": {
-                            "page": page_num,
-                            "start": start,
-                            "end": end,
-                        },
-                    }
-                )
-
-            if end == len(text):
-                break
-
-            start = max(0, end - overlap)
-
-    return chunks
\ No newline at end of file
+                yield {"text": chunk, "meta": {"page": page_num, "start": s, "end": e}}
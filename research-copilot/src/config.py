@@ -13,15 +13,33 @@ DEFAULT_PDF_PATH = DATA_DIR / DEFAULT_PDF_NAME
 CHROMA_DIR = STORAGE_DIR / "chroma"
 CHROMA_COLLECTION = "papers"
 
+# HNSW index parameters, fixed when the collection is first created
+# (search_ef never goes below the 100 the existing store was built with)
+HNSW_M = 24
+HNSW_CONSTRUCTION_EF = 128
+HNSW_SEARCH_EF = 100
+HNSW_BATCH_SIZE = 200
+
 CHUNK_SIZE = 900
 CHUNK_OVERLAP = 150
 
 CHROMA_COLLECTION = "papers"
 EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+EMBEDDING_DEVICE = None  # None = auto-detect (cuda, then mps, then cpu)
+EMBED_BATCH_SIZE = 64
+EMBED_CACHE_PATH = CHROMA_DIR / "embed_cache.db"  # text -> embedding, reused across re-ingests
+EMBED_CACHE_DTYPE = "float16"  # on-disk format of the embedding cache only; Chroma always gets float32
+ADD_BATCH_SIZE = 256  # chunks embedded + inserted per collection.add call
 LLM_MODEL = "llama3.1"
+OLLAMA_BASE_URL = "http://localhost:11434"
+OLLAMA_TIMEOUT = 180
+OLLAMA_MAX_KEEPALIVE = 16  # idle pooled connections kept open to Ollama
 TOP_K = 5
+QUERY_BATCH_WINDOW = 0.005  # seconds to gather concurrent questions into one embedding call
 
 UPLOADS_DIR = DATA_DIR / "uploads"
+PARALLEL_EXTRACT_MIN_PAGES = 8  # PDFs shorter than this are extracted in-process
+UPLOAD_CHUNK_SIZE = 1 << 20  # bytes read per step when saving uploads
 
 API_HOST = "127.0.0.1"
 API_PORT = 8000
\ No newline at end of file
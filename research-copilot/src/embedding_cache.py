@@ -0,0 +1,87 @@
+# src/embedding_cache.py
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Callable, Dict, List, Sequence
+
+import numpy as np
+from blake3 import blake3
+
+
+# Keys per SELECT ... IN (...), well under SQLite's bound-variable limit
+_LOOKUP_BATCH = 500
+
+
+class EmbeddingCache:
+    """
+    On-disk map from BLAKE3(model name + dtype + dim + text) to its embedding, stored as a raw BLOB
+    in `dtype` (float16 halves the file); vectors are always handed back as float32.
+    Re-ingesting unchanged text reads the vectors back instead of running the model. Model, dtype
+    and dimension are part of the key, so changing any of them never reuses vectors written under
+    another setting; a stored blob of the wrong size is treated as a miss.
+    """
+
+    def __init__(self, path: Path, model_name: str, dim: int, dtype: str = "float16"):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Shared by the ingest producer thread and any other caller; all access goes through _lock
+        self._conn = sqlite3.connect(str(path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS embeddings (key BLOB PRIMARY KEY, vec BLOB NOT NULL)")
+        self._conn.commit()
+        self._lock = threading.Lock()
+        self._dtype = np.dtype(dtype)
+        self._dim = dim
+        self._nbytes = dim * self._dtype.itemsize
+        self._prefix = f"{model_name}\0{self._dtype.name}\0{dim}\0".encode("utf-8")
+
+    def _key(self, text: str) -> bytes:
+        return blake3(self._prefix + text.encode("utf-8")).digest()
+
+    def _lookup(self, keys: List[bytes]) -> Dict[bytes, np.ndarray]:
+        found = {}
+        with self._lock:
+            for i in range(0, len(keys), _LOOKUP_BATCH):
+                part = keys[i : i + _LOOKUP_BATCH]
+                rows = self._conn.execute(
+                    f"SELECT key, vec FROM embeddings WHERE key IN ({','.join('?' * len(part))})", part
+                )
+                for key, vec in rows:
+                    if len(vec) == self._nbytes:
+                        found[key] = np.frombuffer(vec, dtype=self._dtype).astype(np.float32)
+        return found
+
+    def _store(self, items: Dict[bytes, np.ndarray]):
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vec) VALUES (?, ?)",
+                [(key, vec.astype(self._dtype).tobytes()) for key, vec in items.items()],
+            )
+
+    def get_or_compute(self, texts: Sequence[str], encode: Callable[[List[str]], np.ndarray]) -> np.ndarray:
+        """
+        Embeddings for `texts` in their original order, shape (len(texts), dim).
+        Only the texts missing from the cache are passed to `encode`, and their vectors are written back.
+        """
+        if not texts:
+            return np.asarray(encode([]), dtype=np.float32)
+
+        keys = [self._key(t) for t in texts]
+        found = self._lookup(list(set(keys)))
+
+        # First occurrence of each missing key, so repeated texts are encoded once
+        misses = {}
+        for i, key in enumerate(keys):
+            if key not in found:
+                misses.setdefault(key, i)
+        if misses:
+            computed = np.asarray(encode([texts[i] for i in misses.values()]), dtype=np.float32)
+            new = dict(zip(misses, computed))
+            self._store(new)
+            found.update(new)
+
+        # Fresh vectors keep full precision; cache hits were upcast from the stored dtype in _lookup
+        return np.stack([found[key] for key in keys])
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -1,35 +1,117 @@
 # src/ingest.py
 from __future__ import annotations
 
+import functools
+import multiprocessing
+import os
+import re
+import threading
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from typing import List, Dict
-from pypdf import PdfReader
+from typing import Dict, Iterator, Tuple
+import pypdfium2 as pdfium
 
 from src.chunk_text import chunk_pages
+from src.config import PARALLEL_EXTRACT_MIN_PAGES
 
 
-def extract_pages_from_pdf(pdf_path: Path) -> List[Dict]:
-    reader = PdfReader(str(pdf_path))
-    pages = []
-    for i, page in enumerate(reader.pages):
-        text = page.extract_text() or ""
-        text = " ".join(text.split())
-        pages.append({"page": i + 1, "text": text})
-    return pages
+_WS_RE = re.compile(r"\s+")
 
+# PDFium extracts text natively (no Python-level content-stream parsing), but it is
+# not thread-safe; pages are independent, so spread them across processes instead
+# (workers are started lazily on first use). Every in-process call holds _PDFIUM_LOCK.
+_PDFIUM_LOCK = threading.Lock()
+_EXTRACT_WORKERS = os.cpu_count() or 1
+# "spawn": workers start from a fresh interpreter instead of forking a server that already
+# runs torch, anyio and ingest threads (a fork copies their locks mid-state)
+_EXTRACTOR_POOL = ProcessPoolExecutor(
+    max_workers=_EXTRACT_WORKERS, mp_context=multiprocessing.get_context("spawn")
+)
 
-def pdf_to_chunks(pdf_path: Path) -> List[Dict]:
+
+def shutdown_extractor():
+    """Stop the extraction workers (API shutdown)."""
+    _EXTRACTOR_POOL.shutdown(wait=True, cancel_futures=True)
+
+
+@functools.lru_cache(maxsize=4)
+def _open_document(path: str, version: Tuple[int, int, int]) -> pdfium.PdfDocument:
+    # One opened document per worker per file version, instead of one per page.
+    # version = (st_ino, st_size, st_mtime_ns): uploads are os.replace'd into place, which always
+    # gives a new inode (the cached handle keeps the old one from being reused), so a same-name
+    # re-upload inside one mtime tick still misses the cache
+    return pdfium.PdfDocument(path)
+
+
+def _page_text(pdf: pdfium.PdfDocument, i: int) -> str:
+    # Close the text page and page right away so PDFium frees them before the next one
+    page = pdf[i]
+    try:
+        textpage = page.get_textpage()
+        try:
+            return textpage.get_text_bounded()
+        finally:
+            textpage.close()
+    finally:
+        page.close()
+
+
+def _page_record(i: int, text: str) -> Dict:
+    return {"page": i + 1, "text": _WS_RE.sub(" ", text).strip()}
+
+
+def _extract_one(args: Tuple[str, Tuple[int, int, int], int]) -> Dict:
+    path, version, i = args
+    return _page_record(i, _page_text(_open_document(path, version), i))
+
+
+def _count_or_extract(path: str):
+    """
+    (n_pages, pages): pages holds the extracted records for short documents,
+    None when the document is long enough to go to the process pool.
+    """
+    # In-process PDFium calls (this runs on ingest threads) must never overlap
+    with _PDFIUM_LOCK:
+        pdf = pdfium.PdfDocument(path)
+        try:
+            n_pages = len(pdf)
+            # Short documents: pool dispatch + per-worker opening would cost more than it saves
+            if n_pages < PARALLEL_EXTRACT_MIN_PAGES:
+                return n_pages, [_page_record(i, _page_text(pdf, i)) for i in range(n_pages)]
+            return n_pages, None
+        finally:
+            pdf.close()
+
+
+def extract_pages_from_pdf(pdf_path: Path) -> Iterator[Dict]:
+    """Yield {"page", "text"} dicts in page order."""
+    path = str(pdf_path)
+    n_pages, pages = _count_or_extract(path)
+    if pages is not None:
+        yield from pages
+        return
+
+    st = os.stat(path)
+    version = (st.st_ino, st.st_size, st.st_mtime_ns)
+    # A few tasks per worker keeps them busy without one IPC round-trip per page
+    chunksize = max(1, n_pages // (_EXTRACT_WORKERS * 4))
+    yield from _EXTRACTOR_POOL.map(
+        _extract_one, [(path, version, i) for i in range(n_pages)], chunksize=chunksize
+    )
+
+
+def pdf_to_chunks(pdf_path: Path) -> Iterator[Dict]:
+    # Lazy end to end: nothing runs until the chunks are consumed (see vector_store.add_chunks)
     pages = extract_pages_from_pdf(pdf_path)
     chunks = chunk_pages(pages)
     return chunks
 
 
-def text_to_chunks(text: str, source_name: str = "pasted_text") -> List[Dict]:
+def text_to_chunks(text: str, source_name: str = "pasted_text") -> Iterator[Dict]:
     """
     Convert raw text into the same chunk format we use for PDFs.
     We treat it as "page 1" for citations.
     """
-    cleaned = " ".join((text or "").split())
+    cleaned = _WS_RE.sub(" ", text or "").strip()
     pages = [{"page": 1, "text": cleaned}]
     return chunk_pages(pages)
-
@@ -1,66 +1,43 @@
 # src/qa_ollama.py
 from __future__ import annotations
 
-from typing import List, Dict
+from typing import List, Dict, TYPE_CHECKING
 import re
-import requests
+import httpx
 
-from src.config import LLM_MODEL
-from typing import Iterator
+from src.config import LLM_MODEL, OLLAMA_BASE_URL, OLLAMA_TIMEOUT, OLLAMA_MAX_KEEPALIVE
+from typing import AsyncIterator
 import json
 
-
-_CITATION_RE = re.compile(r"\[(\d+)\]")
+if TYPE_CHECKING:
+    from src.api.schemas import ChatMessage
 
 
-def build_prompt(question: str, hits: List[Dict], chat_history: List[Dict] | None = None) -> str:
-    """
-    Strict, citation-heavy prompt:
-    - Requires every sentence to end with citations like [1] or [1][2]
-    - Forces a fixed output structure
-    - Forces "INSUFFICIENT_EVIDENCE" when not answerable from evidence
-    """
-
-    history_blocks = []
-    for m in (chat_history or [])[-8:]:  # last 8 turns is enough
-        role = m.get("role", "user")
-        content = (m.get("content") or "").strip()
-        if not content:
-            continue
-        prefix = "ASSISTANT" if role == "assistant" else "USER"
-        history_blocks.append(f"{prefix}: {content}")
-
-    history = "\n".join(history_blocks) if history_blocks else "None"
-    evidence_blocks = []
-    for i, h in enumerate(hits, start=1):
-        src = h["meta"].get("source", "unknown")
-        page = h["meta"].get("page", "?")
-        text = h["text"].strip()
-
-        evidence_blocks.append(
-            f"[{i}] SOURCE: {src} | page {page}\n"
-            f"EVIDENCE:\n{text}\n"
-        )
-
-    evidence = "\n".join(evidence_blocks)
-
-    return f"""You are Research Copilot.
+_CITATION_RE = re.compile(r"\[(\d+)\]")
+# Static parts of every prompt; only history/evidence/question are spliced in per call
+_PROMPT_HEAD = """You are Research Copilot.
 
     You must answer using ONLY the EVIDENCE blocks below.
     CHAT HISTORY is provided for conversational context ONLY — it is NOT evidence.
     Do NOT cite CHAT HISTORY. Citations must ONLY refer to EVIDENCE blocks.
 
     CHAT HISTORY:
-    {history}
+    """
+
+_PROMPT_MID = """
 
     If the evidence does not contain the answer, output exactly:
     INSUFFICIENT_EVIDENCE: <what is missing>
 
     EVIDENCE:
-    {evidence}
+    """
+
+_PROMPT_QUESTION = """
 
     QUESTION:
-    {question}
+    """
+
+_PROMPT_TAIL = """
 
     STRICT RULES (must follow):
     - Do NOT use outside knowledge.
@@ -81,25 +58,76 @@ def build_prompt(question: str, hits: List[Dict], chat_history: List[Dict] | Non
     - <optional 2nd bullet> [#]
     """
 
+_HEADING_RE = re.compile(r"(?m)^(SIMPLE_EXPLANATION|TECHNICAL_EXPLANATION|KEY_EVIDENCE):\s*$")
+# A "sentence" runs from a non-space char up to [.!?] followed by whitespace (or to the end)
+_SENTENCE_RE = re.compile(r"\S.*?(?<=[.!?])(?=\s)|\S.*", re.S)
+
+# Shared across requests so connections to Ollama are pooled and kept alive
+_OLLAMA = httpx.AsyncClient(
+    base_url=OLLAMA_BASE_URL,
+    timeout=OLLAMA_TIMEOUT,
+    limits=httpx.Limits(max_keepalive_connections=OLLAMA_MAX_KEEPALIVE),
+)
+
+
+def build_prompt(
+    question: str, hits: List[Dict], chat_history: List[ChatMessage] | List[Dict] | None = None
+) -> str:
+    """
+    Strict, citation-heavy prompt:
+    - Requires every sentence to end with citations like [1] or [1][2]
+    - Forces a fixed output structure
+    - Forces "INSUFFICIENT_EVIDENCE" when not answerable from evidence
+    chat_history may hold ChatMessage models (API) or plain dicts (scripts).
+    """
+
+    history_blocks = []
+    for m in (chat_history or [])[-8:]:  # last 8 turns is enough
+        if isinstance(m, dict):
+            role, content = m.get("role", "user"), m.get("content")
+        else:
+            role, content = m.role, m.content
+        content = (content or "").strip()
+        if not content:
+            continue
+        prefix = "ASSISTANT" if role == "assistant" else "USER"
+        history_blocks.append(f"{prefix}: {content}")
+
+    history = "\n".join(history_blocks) if history_blocks else "None"
+    evidence = "\n".join(
+        f"[{i}] SOURCE: {h['meta'].get('source', 'unknown')} | page {h['meta'].get('page', '?')}\n"
+        f"EVIDENCE:\n{h['text'].strip()}\n"
+        for i, h in enumerate(hits, start=1)
+    )
+
+    return "".join(
+        (_PROMPT_HEAD, history, _PROMPT_MID, evidence, _PROMPT_QUESTION, question, _PROMPT_TAIL)
+    )
+
+
+
+async def aclose_ollama():
+    """Close pooled Ollama connections (call on app shutdown)."""
+    await _OLLAMA.aclose()
 
 
-def ollama_generate(prompt: str, model: str = LLM_MODEL) -> str:
-    r = requests.post(
-        "http://localhost:11434/api/generate",
+async def ollama_generate(prompt: str, model: str = LLM_MODEL) -> str:
+    r = await _OLLAMA.post(
+        "/api/generate",
         json={"model": model, "prompt": prompt, "stream": False},
-        timeout=180,
     )
     r.raise_for_status()
     return r.json()["response"].strip()
 
 
-def _has_citations(text: str) -> bool:
-    return bool(_CITATION_RE.search(text))
-
-
 def _citations_within_range(text: str, max_id: int) -> bool:
-    ids = [int(m.group(1)) for m in _CITATION_RE.finditer(text)]
-    return all(1 <= i <= max_id for i in ids) if ids else False
+    # Also covers "has at least one citation"; stops at the first out-of-range id
+    found = False
+    for m in _CITATION_RE.finditer(text):
+        if not 1 <= int(m.group(1)) <= max_id:
+            return False
+        found = True
+    return found
 
 
 def _every_nonempty_sentence_has_citation(text: str) -> bool:
@@ -108,31 +136,31 @@ def _every_nonempty_sentence_has_citation(text: str) -> bool:
     Not perfect NLP, but works well in practice.
     """
     # Remove headings to avoid false negatives
-    cleaned = re.sub(r"(?m)^(SIMPLE_EXPLANATION|TECHNICAL_EXPLANATION|KEY_EVIDENCE):\s*$", "", text).strip()
-    # Split into sentences heuristically
-    parts = re.split(r"(?<=[.!?])\s+", cleaned)
-    for s in parts:
-        s = s.strip()
-        if not s:
-            continue
-        # Allow bullet lines as "sentences" too
-        if not _CITATION_RE.search(s):
-            return False
-    return True
+    cleaned = _HEADING_RE.sub("", text)
+    # Walk sentences in one scan (bullet lines count as "sentences" too)
+    return all(_CITATION_RE.search(m.group()) for m in _SENTENCE_RE.finditer(cleaned))
 
 
-def answer(question: str, hits: List[Dict], chat_history: List[Dict] | None = None) -> str:
+async def answer(
+    question: str, hits: List[Dict], chat_history: List[ChatMessage] | List[Dict] | None = None
+) -> str:
     """
     Generate an answer with a lightweight citation guard:
     - If missing citations or citing out-of-range blocks, reprompt once with an even stricter reminder.
+    - An INSUFFICIENT_EVIDENCE answer is accepted as-is.
     """
     prompt = build_prompt(question, hits, chat_history=chat_history)
-    out = ollama_generate(prompt, model=LLM_MODEL)
+    out = await ollama_generate(prompt, model=LLM_MODEL)
+
+    # The prompt's sanctioned refusal carries no citations; don't spend a reprompt on it
+    if out.startswith("INSUFFICIENT_EVIDENCE"):
+        return out
 
     max_id = len(hits)
 
+    # Cheapest checks first: a substring test rejects citation-free output before any regex runs
     ok = (
-        _has_citations(out)
+        "[" in out
         and _citations_within_range(out, max_id)
         and _every_nonempty_sentence_has_citation(out)
     )
@@ -148,26 +176,25 @@ def answer(question: str, hits: List[Dict], chat_history: List[Dict] | None = No
     - Every sentence must end with citations like [1] or [1][2].
     - If you cannot answer from evidence, output INSUFFICIENT_EVIDENCE.
     """
-    out2 = ollama_generate(reprompt, model=LLM_MODEL)
+    out2 = await ollama_generate(reprompt, model=LLM_MODEL)
     return out2
 
 
 
 
-def ollama_generate_stream(prompt: str, model: str = LLM_MODEL) -> Iterator[str]:
+async def ollama_generate_stream(prompt: str, model: str = LLM_MODEL) -> AsyncIterator[str]:
     """
     Stream tokens from Ollama /api/generate.
-    Yields incremental text chunks (tokens).
+    Yields incremental text chunks (tokens) without leaving the event loop.
     """
-    with requests.post(
-        "http://localhost:11434/api/generate",
+    async with _OLLAMA.stream(
+        "POST",
+        "/api/generate",
         json={"model": model, "prompt": prompt, "stream": True},
-        stream=True,
-        timeout=180,
     ) as r:
         r.raise_for_status()
 
-        for line in r.iter_lines(decode_unicode=True):
+        async for line in r.aiter_lines():
             if not line:
                 continue
             data = json.loads(line)
@@ -181,10 +208,13 @@ def ollama_generate_stream(prompt: str, model: str = LLM_MODEL) -> Iterator[str]
                 yield chunk
 
 
-def answer_stream(question: str, hits: List[Dict], chat_history: List[Dict] | None = None) -> Iterator[str]:
+async def answer_stream(
+    question: str, hits: List[Dict], chat_history: List[ChatMessage] | List[Dict] | None = None
+) -> AsyncIterator[str]:
     """
     Stream an answer (tokens) using the same strict prompt rules.
     Note: We can't run the full citation guard mid-stream.
     """
     prompt = build_prompt(question, hits, chat_history=chat_history)
-    yield from ollama_generate_stream(prompt, model=LLM_MODEL)
+    async for tok in ollama_generate_stream(prompt, model=LLM_MODEL):
+        yield tok
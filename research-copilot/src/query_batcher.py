@@ -0,0 +1,65 @@
+# src/query_batcher.py
+from __future__ import annotations
+
+import asyncio
+import functools
+from typing import Optional, Tuple
+
+import numpy as np
+
+from src.vector_store import embed_texts
+
+
+class QueryEmbeddingBatcher:
+    """
+    Coalesces question embeddings from concurrent requests into one model call.
+    The first queued question opens a short window; everything queued by the
+    end of it is encoded together, then each caller gets its own vector back.
+    """
+
+    def __init__(self, window: float = 0.005):
+        self.window = window
+        self._queue: Optional[asyncio.Queue[Tuple[str, asyncio.Future]]] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        # Must be called from inside the running event loop (app startup)
+        self._queue = asyncio.Queue()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def embed(self, question: str) -> np.ndarray:
+        fut = asyncio.get_running_loop().create_future()
+        await self._queue.put((question, fut))
+        return await fut
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            await asyncio.sleep(self.window)
+            while not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+
+            questions = [q for q, _ in batch]
+            try:
+                # The model call blocks, so keep it off the event loop
+                # Questions stay out of the on-disk embedding cache (it is for document chunks)
+                embeddings = await loop.run_in_executor(None, functools.partial(embed_texts, questions, cache=False))
+            except Exception as e:
+                for _, fut in batch:
+                    if not fut.done():
+                        fut.set_exception(e)
+                continue
+
+            for (_, fut), emb in zip(batch, embeddings):
+                if not fut.done():
+                    fut.set_result(emb)
@@ -1,17 +1,21 @@
 # src/read_pdf.py
 from pathlib import Path
+import re
 import sys
 from pypdf import PdfReader
 
 from config import DEFAULT_PDF_PATH
 
 
+_WS_RE = re.compile(r"\s+")
+
+
 def extract_pages(pdf_path: Path):
     reader = PdfReader(str(pdf_path))
     pages = []
     for i, page in enumerate(reader.pages):
         text = page.extract_text() or ""
-        text = " ".join(text.split())
+        text = _WS_RE.sub(" ", text).strip()
         pages.append({"page": i + 1, "text": text})
     return pages
 
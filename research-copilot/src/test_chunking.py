@@ -1,23 +1,28 @@
 # src/test_chunking.py
+import re
+
 from pypdf import PdfReader
 
 from config import DEFAULT_PDF_PATH
 from chunk_text import chunk_pages
 
 
+_WS_RE = re.compile(r"\s+")
+
+
 def extract_pages(pdf_path):
     reader = PdfReader(str(pdf_path))
     pages = []
     for i, page in enumerate(reader.pages):
         text = page.extract_text() or ""
-        text = " ".join(text.split())
+        text = _WS_RE.sub(" ", text).strip()
         pages.append({"page": i + 1, "text": text})
     return pages
 
 
 def main():
     pages = extract_pages(DEFAULT_PDF_PATH)
-    chunks = chunk_pages(pages)
+    chunks = list(chunk_pages(pages))
 
     print(f"PDF: {DEFAULT_PDF_PATH}")
     print(f"Pages: {len(pages)}")
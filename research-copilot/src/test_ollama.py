@@ -1,9 +1,9 @@
-import requests
+import httpx
 
 MODEL = "llama3.1"
 
 def ollama_generate(prompt: str) -> str:
-    r = requests.post(
+    r = httpx.post(
         "http://localhost:11434/api/generate",
         json={"model": MODEL, "prompt": prompt, "stream": False},
         timeout=120,
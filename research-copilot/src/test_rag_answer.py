@@ -1,4 +1,7 @@
 # src/test_rag_answer.py
+import asyncio
+import re
+
 from pypdf import PdfReader
 
 from config import DEFAULT_PDF_PATH, TOP_K
@@ -7,17 +10,20 @@ from vector_store import reset_collection, get_collection, add_chunks, query
 from qa_ollama import answer
 
 
+_WS_RE = re.compile(r"\s+")
+
+
 def extract_pages(pdf_path):
     reader = PdfReader(str(pdf_path))
     pages = []
     for i, page in enumerate(reader.pages):
         text = page.extract_text() or ""
-        text = " ".join(text.split())
+        text = _WS_RE.sub(" ", text).strip()
         pages.append({"page": i + 1, "text": text})
     return pages
 
 
-def main():
+async def main():
     reset_collection()
     _, collection = get_collection()
 
@@ -46,7 +52,7 @@ def main():
             print(f"\n[{i}] {src} | page {page} | dist={dist:.4f}")
             print(h["text"])
 
-        out = answer(q, hits)
+        out = await answer(q, hits)
 
         print("\n====================")
         print("ANSWER (GROUNDED)")
@@ -55,4 +61,5 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
+    # One event loop for the whole session so the pooled Ollama client stays usable
+    asyncio.run(main())
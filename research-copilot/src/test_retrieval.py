@@ -1,4 +1,6 @@
 # src/test_retrieval.py
+import re
+
 from pypdf import PdfReader
 
 from config import DEFAULT_PDF_PATH, TOP_K
@@ -6,14 +8,16 @@ from chunk_text import chunk_pages
 from vector_store import reset_collection, get_collection, add_chunks, query
 
 
+_WS_RE = re.compile(r"\s+")
+
+
 def extract_pages(pdf_path):
+    # Generator: pages flow straight into chunk_pages/add_chunks without a full list
     reader = PdfReader(str(pdf_path))
-    pages = []
     for i, page in enumerate(reader.pages):
         text = page.extract_text() or ""
-        text = " ".join(text.split())
-        pages.append({"page": i + 1, "text": text})
-    return pages
+        text = _WS_RE.sub(" ", text).strip()
+        yield {"page": i + 1, "text": text}
 
 
 def main():
@@ -34,8 +38,8 @@ def main():
         "What website is included?",
     ]
 
-    for q in questions:
-        hits = query(collection, q, k=TOP_K)
+    # One batched retrieval for all questions
+    for q, hits in zip(questions, query(collection, questions, k=TOP_K)):
         print("\n====================")
         print("Q:", q)
         print("Top hit:", f"{hits[0]['meta']['source']} page {hits[0]['meta']['page']} dist={hits[0]['distance']:.4f}")
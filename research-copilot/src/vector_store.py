@@ -1,74 +1,267 @@
 # src/vector_store.py
-import hashlib
-from typing import List, Dict
+import functools
+import os
+import queue
+import threading
+from itertools import islice
+from typing import List, Dict, Iterable, Optional, Sequence, Set, Union
 
 import chromadb
+import numpy as np
+import torch
+from blake3 import blake3
+from chromadb.api.types import Documents, Embeddings
 from chromadb.utils.embedding_functions import SentenceTransformerEmbeddingFunction
 
-from src.config import CHROMA_DIR, CHROMA_COLLECTION, EMBEDDING_MODEL
+from src.embedding_cache import EmbeddingCache
+from src.config import (
+    CHROMA_DIR,
+    CHROMA_COLLECTION,
+    EMBEDDING_MODEL,
+    EMBEDDING_DEVICE,
+    EMBED_BATCH_SIZE,
+    EMBED_CACHE_PATH,
+    EMBED_CACHE_DTYPE,
+    ADD_BATCH_SIZE,
+    HNSW_M,
+    HNSW_CONSTRUCTION_EF,
+    HNSW_SEARCH_EF,
+    HNSW_BATCH_SIZE,
+)
+
+
+# Let CPU encoding use every core (set once, at import)
+torch.set_num_threads(os.cpu_count() or 1)
+
+
+class BatchedSentenceTransformerEmbeddingFunction(SentenceTransformerEmbeddingFunction):
+    """
+    Same model as Chroma's SentenceTransformer function, but encodes in large
+    batches and returns unit vectors (cosine space), so one call covers a whole document.
+    """
+
+    def encode_array(self, texts: List[str], cache: bool = True) -> np.ndarray:
+        """
+        (len(texts), dim) float32 array, the dtype Chroma's index stores (no casts on the way in).
+        cache=True (document chunks): texts embedded before, e.g. a re-ingested PDF, come from the
+        disk cache and only misses hit the model. Questions pass cache=False so they are never persisted.
+        """
+        if not cache:
+            return self._encode(texts)
+        return _embedding_cache().get_or_compute(texts, self._encode)
+
+    def _encode(self, texts: List[str]) -> np.ndarray:
+        # encode() already orders each call by text length before splitting it into
+        # EMBED_BATCH_SIZE mini-batches (and restores input order), so every ADD_BATCH_SIZE
+        # batch is padded per length bucket; pre-sorting here would change nothing
+        embeddings = self._model.encode(
+            texts,
+            batch_size=EMBED_BATCH_SIZE,
+            convert_to_numpy=True,
+            normalize_embeddings=True,
+            show_progress_bar=False,
+        )
+        return embeddings.astype(np.float32, copy=False)
+
+    def __call__(self, input: Documents) -> Embeddings:
+        return list(self.encode_array(list(input)))
+
+    def embed_query(self, input: Documents) -> Embeddings:
+        return list(self.encode_array(list(input), cache=False))
+
+
+def _pick_device() -> str:
+    if EMBEDDING_DEVICE:
+        return EMBEDDING_DEVICE
+    if torch.cuda.is_available():
+        return "cuda"
+    if torch.backends.mps.is_available():
+        return "mps"
+    return "cpu"
+
+
+@functools.lru_cache(maxsize=1)
+def _embedding_fn() -> BatchedSentenceTransformerEmbeddingFunction:
+    # Built once per process: loading the model is the slow part
+    return BatchedSentenceTransformerEmbeddingFunction(model_name=EMBEDDING_MODEL, device=_pick_device())
+
+
+@functools.lru_cache(maxsize=1)
+def _embedding_cache() -> EmbeddingCache:
+    dim = _embedding_fn()._model.get_sentence_embedding_dimension()
+    return EmbeddingCache(EMBED_CACHE_PATH, model_name=EMBEDDING_MODEL, dim=dim, dtype=EMBED_CACHE_DTYPE)
+
+
+def embed_texts(texts: List[str], cache: bool = True) -> np.ndarray:
+    return _embedding_fn().encode_array(texts, cache=cache)
 
 
 def make_id(source: str, page: int, start: int, end: int, text: str) -> str:
     key = f"{source}|{page}|{start}|{end}|{text}"
-    return hashlib.sha1(key.encode("utf-8")).hexdigest()
+    # 20-byte BLAKE3 digest: same 40-hex id length as before, SIMD-accelerated hashing
+    return blake3(key.encode("utf-8")).hexdigest(length=20)
+
+
+@functools.lru_cache(maxsize=4)
+def _client(path: str):
+    # One PersistentClient per storage path for the whole process
+    return chromadb.PersistentClient(path=path)
 
 
 def get_collection():
-    client = chromadb.PersistentClient(path=str(CHROMA_DIR))
-    embedding_fn = SentenceTransformerEmbeddingFunction(model_name=EMBEDDING_MODEL)
+    client = _client(str(CHROMA_DIR))
 
     collection = client.get_or_create_collection(
         name=CHROMA_COLLECTION,
-        embedding_function=embedding_fn,
-        metadata={"hnsw:space": "cosine"},
+        embedding_function=_embedding_fn(),
+        metadata={
+            "hnsw:space": "cosine",
+            "hnsw:M": HNSW_M,
+            "hnsw:construction_ef": HNSW_CONSTRUCTION_EF,
+            "hnsw:search_ef": HNSW_SEARCH_EF,
+            "hnsw:batch_size": HNSW_BATCH_SIZE,
+        },
     )
     return client, collection
 
 
 def reset_collection():
-    client = chromadb.PersistentClient(path=str(CHROMA_DIR))
+    client = _client(str(CHROMA_DIR))
     try:
         client.delete_collection(CHROMA_COLLECTION)
     except Exception:
         pass
 
 
-def add_chunks(collection, chunks: List[Dict], source_name: str):
-    texts = []
-    metadatas = []
-    ids = []
+def _embedded_batches(chunks: Iterable[Dict], source_name: str, doc_id: Optional[str]):
+    """Yield (texts, metadatas, ids, embeddings) per ADD_BATCH_SIZE chunks, consuming `chunks` lazily."""
+    it = iter(chunks)
 
-    for c in chunks:
-        text = c["text"]
-        meta = c["meta"].copy()
-        meta["source"] = source_name
+    # Per-chunk fields added to every metadata dict
+    extra = {"source": source_name, "doc_id": doc_id} if doc_id else {"source": source_name}
+    _mk = make_id
 
-        _id = make_id(
-            source=source_name,
-            page=meta["page"],
-            start=meta["start"],
-            end=meta["end"],
-            text=text,
-        )
+    while batch := list(islice(it, ADD_BATCH_SIZE)):
+        texts, metadatas, ids = zip(*[
+            (
+                c["text"],
+                {**c["meta"], **extra},
+                _mk(source_name, c["meta"]["page"], c["meta"]["start"], c["meta"]["end"], c["text"]),
+            )
+            for c in batch
+        ])
+        texts, metadatas, ids = list(texts), list(metadatas), list(ids)
+
+        # Embed the batch in one call instead of leaving it to Chroma
+        yield texts, metadatas, ids, embed_texts(texts)
+
+
+_DONE = object()
+
+
+def add_chunks(collection, chunks: Iterable[Dict], source_name: str, doc_id: Optional[str] = None) -> int:
+    """
+    Embed + insert chunks in batches of ADD_BATCH_SIZE, so peak memory is a couple of
+    batches rather than the whole document. A background thread embeds batch k+1 while
+    this thread inserts batch k into the index. Returns the total added.
+    Upserts: a chunk id that is already stored (same source, offsets and text) takes
+    this call's metadata, so its doc_id always names the latest ingest of the source.
+    """
+    # maxsize=2: the producer runs at most two batches ahead of the inserts
+    batches: queue.Queue = queue.Queue(maxsize=2)
+    stop = threading.Event()
+
+    def produce():
+        try:
+            for batch in _embedded_batches(chunks, source_name, doc_id):
+                if stop.is_set():
+                    return
+                batches.put(batch)
+        except BaseException as e:
+            batches.put(e)
+        finally:
+            batches.put(_DONE)
+
+    producer = threading.Thread(target=produce, name="add_chunks-embed", daemon=True)
+    producer.start()
+
+    total = 0
+    try:
+        while (item := batches.get()) is not _DONE:
+            if isinstance(item, BaseException):
+                raise item
+            texts, metadatas, ids, embeddings = item
+            collection.upsert(documents=texts, metadatas=metadatas, ids=ids, embeddings=embeddings)
+            total += len(texts)
+    finally:
+        # On an insert error, stop the producer and unblock it if it is waiting on a full queue
+        stop.set()
+        while producer.is_alive():
+            try:
+                batches.get(timeout=0.1)
+            except queue.Empty:
+                pass
+
+    return total
+
+
+def known_doc_ids(collection, where: Optional[Dict] = None) -> Set[str]:
+    """Collect the distinct doc_id values stored in chunk metadata."""
+    data = collection.get(where=where, include=["metadatas"])
+    metas = data.get("metadatas", []) or []
+    return {m["doc_id"] for m in metas if isinstance(m, dict) and m.get("doc_id")}
+
+
+def count_source_chunks(collection, source_name: str) -> int:
+    """Number of chunks stored for one source (ids only, no documents or metadata)."""
+    return len(collection.get(where={"source": source_name}, include=[])["ids"])
+
+
+_PREVIEW_CHARS = 240
 
-        texts.append(text)
-        metadatas.append(meta)
-        ids.append(_id)
 
-    collection.add(documents=texts, metadatas=metadatas, ids=ids)
-    return len(texts)
+def _summarize(_id: str, text: Optional[str], meta: Optional[Dict], dist: Optional[float]) -> Dict:
+    """Coerced, UI-ready view of a hit (the API's SourceItem fields), built once per hit."""
+    meta = meta or {}
+    text = text or ""
+    return {
+        "source": str(meta.get("source", "unknown")),
+        "page": int(meta.get("page", 0) or 0),
+        "distance": float(dist or 0.0),
+        "chunk_id": _id,
+        "start": meta.get("start"),
+        "end": meta.get("end"),
+        "chunk_preview": text[:_PREVIEW_CHARS] + ("..." if len(text) > _PREVIEW_CHARS else ""),
+    }
 
 
-def query(collection, question: str, k: int = 5):
-    res = collection.query(query_texts=[question], n_results=k)
-    hits = []
+def query(
+    collection,
+    questions: Union[str, List[str]],
+    k: int = 5,
+    query_embeddings: Optional[Sequence[np.ndarray]] = None,
+):
+    """
+    Retrieve the top-k chunks for one question or a batch of questions.
+    A batch goes to Chroma as a single query (one encode call, one index pass);
+    a str returns a list of hits, a list returns one list of hits per question.
+    """
+    single = isinstance(questions, str)
+    if single:
+        questions = [questions]
 
-    docs = res["documents"][0]
-    metas = res["metadatas"][0]
-    dists = res["distances"][0]
-    ids = res.get("ids", [[]])[0]
+    # Precomputed embeddings (e.g. from the API's query batcher) skip encoding the questions here;
+    # otherwise encode them ourselves (bypassing the on-disk cache) rather than via Chroma's embedder
+    if query_embeddings is None:
+        query_embeddings = embed_texts(questions, cache=False)
+    res = collection.query(query_embeddings=np.asarray(query_embeddings, dtype=np.float32), n_results=k)
 
-    for doc, meta, dist, _id in zip(docs, metas, dists, ids):
-        hits.append({"id": _id, "text": doc, "meta": meta, "distance": dist})
+    all_ids = res.get("ids") or [[] for _ in questions]
+    results = []
+    for docs, metas, dists, ids in zip(res["documents"], res["metadatas"], res["distances"], all_ids):
+        hits = []
+        for doc, meta, dist, _id in zip(docs, metas, dists, ids):
+            hits.append({"id": _id, "text": doc, "meta": meta, "distance": dist, "summary": _summarize(_id, doc, meta, dist)})
+        results.append(hits)
 
-    return hits
+    return results[0] if single else results
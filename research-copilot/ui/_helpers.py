@@ -0,0 +1,63 @@
+# ui/_helpers.py
+from typing import Any, Dict, List
+
+import orjson
+import pandas as pd
+import requests
+import streamlit as st
+
+__all__ = ["ask_stream", "render_sources"]
+
+
+def ask_stream(api_base: str, payload: dict, session: requests.Session):
+    """
+    Yields events from /ask/stream (NDJSON):
+      {"type":"token","data":"..."}
+      {"type":"sources","data":[...]}
+      {"type":"done"}
+    """
+    with session.post(
+        f"{api_base}/ask/stream",
+        json=payload,
+        stream=True,
+        timeout=300,
+    ) as r:
+        r.raise_for_status()
+        # Split raw bytes on newlines ourselves (no per-line unicode decoding); orjson parses bytes directly
+        buf = bytearray()
+        for chunk in r.iter_content(chunk_size=4096):
+            buf += chunk
+            start = 0
+            while (nl := buf.find(b"\n", start)) != -1:
+                if nl > start:
+                    yield orjson.loads(buf[start:nl])
+                start = nl + 1
+            del buf[:start]
+        if buf.strip():
+            yield orjson.loads(buf)
+
+
+def render_sources(sources: List[Dict[str, Any]]):
+    """Render sources in a compact, readable way."""
+    if not sources:
+        st.info("No sources returned.")
+        return
+
+    # One columnar table (scan-friendly); previews are a column instead of per-row markdown
+    cols = {
+        "#": list(range(1, len(sources) + 1)),
+        "source": [s.get("source", "unknown") for s in sources],
+        "page": [s.get("page", 0) for s in sources],
+        "distance": [float(s.get("distance", 0.0)) for s in sources],
+        "preview": [s.get("chunk_preview", "") for s in sources],
+    }
+
+    df = pd.DataFrame(cols).sort_values("distance", ascending=True)
+    st.dataframe(
+        df,
+        column_config={"preview": st.column_config.TextColumn(width="large")},
+        use_container_width=True,
+        hide_index=True,
+    )
+
+    st.caption("Tip: lower distance generally means the chunk is more relevant.")
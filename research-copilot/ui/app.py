@@ -1,36 +1,53 @@
 # ui/app.py
-import json
 from typing import Dict, Any, List
 
 import pandas as pd
 import requests
 import streamlit as st
+import time
 import uuid
+from requests.adapters import HTTPAdapter
+from requests_toolbelt.multipart.encoder import MultipartEncoder
+
+from _helpers import ask_stream, render_sources
+
+# Must be the first Streamlit call of every run
+st.set_page_config(page_title="Research Copilot", layout="wide")
 
 API_BASE = "http://127.0.0.1:8000"
 
+# Streaming answer redraw throttle
+RENDER_INTERVAL = 0.08  # seconds
+RENDER_EVERY_TOKENS = 16
+
 
 # -----------------------------
 # Helpers
 # -----------------------------
-def ask_stream(api_base: str, payload: dict):
-    """
-    Yields events from /ask/stream (NDJSON):
-      {"type":"token","data":"..."}
-      {"type":"sources","data":[...]}
-      {"type":"done"}
-    """
-    with requests.post(
-        f"{api_base}/ask/stream",
-        json=payload,
-        stream=True,
-        timeout=300,
-    ) as r:
-        r.raise_for_status()
-        for line in r.iter_lines(decode_unicode=True):
-            if not line:
-                continue
-            yield json.loads(line)
+@st.cache_resource
+def get_session() -> requests.Session:
+    # One keep-alive connection pool for every UI -> API call, kept across reruns
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=8)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+SESSION = get_session()
+
+
+@st.cache_data(ttl=30, show_spinner=False)
+def _fetch_documents(api_base: str) -> List[Dict[str, Any]]:
+    r = SESSION.get(f"{api_base}/documents", timeout=30)
+    r.raise_for_status()
+    return r.json().get("documents", [])
+
+
+def refresh_documents():
+    # After a mutation (or an explicit Refresh) the cached list is stale
+    _fetch_documents.clear()
+    st.session_state["documents"] = _fetch_documents(API_BASE)
 
 
 def get_active_chat():
@@ -38,6 +55,17 @@ def get_active_chat():
     return st.session_state["conversations"][cid]["chat"]
 
 
+def index_conversations():
+    """Cache conversation ids/titles and their lookup maps; call again whenever conversations are added."""
+    convs = st.session_state["conversations"]
+    conv_ids = list(convs.keys())
+    conv_titles = [convs[cid]["title"] for cid in conv_ids]
+    st.session_state["conv_ids"] = conv_ids
+    st.session_state["conv_titles"] = conv_titles
+    st.session_state["id_to_pos"] = {cid: i for i, cid in enumerate(conv_ids)}
+    st.session_state["title_to_id"] = dict(zip(conv_titles, conv_ids))
+
+
 def render_chat():
     for m in get_active_chat():
         role = m.get("role", "user")
@@ -46,41 +74,6 @@ def render_chat():
             st.markdown(content)
 
 
-def render_sources(sources: List[Dict[str, Any]]):
-    """Render sources in a compact, readable way."""
-    if not sources:
-        st.info("No sources returned.")
-        return
-
-    # Compact table first (scan-friendly)
-    rows = []
-    for i, s in enumerate(sources, start=1):
-        rows.append(
-            {
-                "#": i,
-                "source": s.get("source", "unknown"),
-                "page": s.get("page", 0),
-                "distance": float(s.get("distance", 0.0)),
-            }
-        )
-
-    df = pd.DataFrame(rows).sort_values("distance", ascending=True)
-    st.dataframe(df, use_container_width=True, hide_index=True)
-
-    st.caption("Tip: lower distance generally means the chunk is more relevant.")
-
-    # Details below
-    for i, s in enumerate(sources, start=1):
-        src = s.get("source", "unknown")
-        page = s.get("page", 0)
-        dist = float(s.get("distance", 0.0))
-        preview = s.get("chunk_preview", "")
-
-        st.markdown(f"**[{i}] {src} — page {page} — dist {dist:.4f}**")
-        st.write(preview)
-        st.divider()
-
-
 # -----------------------------
 # Session state init
 # -----------------------------
@@ -96,14 +89,20 @@ if "active_conversation" not in st.session_state:
     # fallback safety
     st.session_state["active_conversation"] = next(iter(st.session_state["conversations"].keys()))  # list of {"role": "user"/"assistant", "content": str}
 
+if "conv_ids" not in st.session_state:
+    index_conversations()
+
 if "documents" not in st.session_state:
-    st.session_state["documents"] = []  # list of {"source": str, "chunks": int}
+    # list of {"source": str, "chunks": int}; new sessions share the cached fetch
+    try:
+        st.session_state["documents"] = _fetch_documents(API_BASE)
+    except Exception:
+        st.session_state["documents"] = []
 
 
 # -----------------------------
-# Page config
+# Page header
 # -----------------------------
-st.set_page_config(page_title="Research Copilot", layout="wide")
 st.title("📄 Research Copilot (RAG)")
 st.caption("Upload PDFs or paste text, then chat. Answers are grounded in retrieved evidence with citations.")
 
@@ -117,7 +116,7 @@ with st.sidebar:
     # Health check
     if st.button("✅ Check API health", width='stretch'):
         try:
-            r = requests.get(f"{API_BASE}/health", timeout=10)
+            r = SESSION.get(f"{API_BASE}/health", timeout=10)
             r.raise_for_status()
             st.success(r.json())
         except Exception as e:
@@ -137,16 +136,15 @@ with st.sidebar:
 
     if refresh:
         try:
-            r = requests.get(f"{API_BASE}/documents", timeout=30)
-            r.raise_for_status()
-            st.session_state["documents"] = r.json().get("documents", [])
+            refresh_documents()
         except Exception as e:
             st.error(f"Failed to fetch documents: {e}")
 
     if wipe:
         try:
-            r = requests.post(f"{API_BASE}/documents/reset", timeout=60)
+            r = SESSION.post(f"{API_BASE}/documents/reset", timeout=60)
             r.raise_for_status()
+            _fetch_documents.clear()
             st.session_state["documents"] = []
             st.success("Vector DB reset.")
         except Exception as e:
@@ -163,14 +161,12 @@ with st.sidebar:
 
         if st.button("🗑️ Delete selected", type="primary", width='stretch'):
             try:
-                r = requests.delete(f"{API_BASE}/documents/{selected}", timeout=30)
+                r = SESSION.delete(f"{API_BASE}/documents/{selected}", timeout=30)
                 r.raise_for_status()
                 st.success(f"Deleted: {selected}")
 
                 # refresh immediately
-                r2 = requests.get(f"{API_BASE}/documents", timeout=30)
-                r2.raise_for_status()
-                st.session_state["documents"] = r2.json().get("documents", [])
+                refresh_documents()
             except Exception as e:
                 st.error(f"Delete failed: {e}")
     else:
@@ -186,8 +182,16 @@ with st.sidebar:
         if st.button("Ingest PDF", width='stretch'):
             with st.spinner("Uploading and ingesting..."):
                 try:
-                    files = {"file": (uploaded.name, uploaded.getvalue(), "application/pdf")}
-                    r = requests.post(f"{API_BASE}/ingest/pdf", files=files, timeout=300)
+                    # Stream the multipart body straight from the uploaded buffer (no getvalue() copy,
+                    # no fully built request body)
+                    uploaded.seek(0)
+                    body = MultipartEncoder(fields={"file": (uploaded.name, uploaded, "application/pdf")})
+                    r = SESSION.post(
+                        f"{API_BASE}/ingest/pdf",
+                        data=body,
+                        headers={"Content-Type": body.content_type},
+                        timeout=300,
+                    )
                     if r.status_code != 200:
                         st.error(f"Ingest failed ({r.status_code}): {r.text}")
                     else:
@@ -195,9 +199,7 @@ with st.sidebar:
                         st.success(f"Ingested {data.get('filename')} (chunks: {data.get('chunks_added')})")
                         # auto refresh docs
                         try:
-                            r2 = requests.get(f"{API_BASE}/documents", timeout=30)
-                            r2.raise_for_status()
-                            st.session_state["documents"] = r2.json().get("documents", [])
+                            refresh_documents()
                         except Exception:
                             pass
                 except Exception as e:
@@ -215,7 +217,7 @@ with st.sidebar:
             with st.spinner("Ingesting text..."):
                 try:
                     payload = {"text": pasted_text, "source_name": source_name.strip() or "pasted_text"}
-                    r = requests.post(f"{API_BASE}/ingest/text", json=payload, timeout=300)
+                    r = SESSION.post(f"{API_BASE}/ingest/text", json=payload, timeout=300)
                     if r.status_code != 200:
                         st.error(f"Ingest failed ({r.status_code}): {r.text}")
                     else:
@@ -223,9 +225,7 @@ with st.sidebar:
                         st.success(f"Ingested '{data.get('source_name')}' (chunks: {data.get('chunks_added')})")
                         # auto refresh docs
                         try:
-                            r2 = requests.get(f"{API_BASE}/documents", timeout=30)
-                            r2.raise_for_status()
-                            st.session_state["documents"] = r2.json().get("documents", [])
+                            refresh_documents()
                         except Exception:
                             pass
                 except Exception as e:
@@ -236,23 +236,15 @@ with st.sidebar:
 # Main: Chat UI
 # -----------------------------
 st.subheader("💬 Chat with your documents")
-top_bar = st.columns([2, 1])
-with top_bar[0]:
-    top_k = st.slider(
-        "Top-K chunks to retrieve",
-        min_value=1,
-        max_value=10,
-        value=5,
-    )
-with top_bar[1]:
-    if st.button("🧹 Clear chat", use_container_width=True):
-        get_active_chat().clear()
-        st.session_state.pop("last_answer", None)
-        st.rerun()
+top_k = st.slider(
+    "Top-K chunks to retrieve",
+    min_value=1,
+    max_value=10,
+    value=5,
+)
 
-# Conversation controls
-conv_ids = list(st.session_state["conversations"].keys())
-conv_titles = [st.session_state["conversations"][cid]["title"] for cid in conv_ids]
+# Conversation controls (ids/titles cached in session state by index_conversations)
+conv_titles = st.session_state["conv_titles"]
 
 cA, cB, cC = st.columns([3, 1, 1])
 
@@ -260,10 +252,10 @@ with cA:
     selected_title = st.selectbox(
         "Conversation",
         conv_titles,
-        index=conv_ids.index(st.session_state["active_conversation"]),
+        index=st.session_state["id_to_pos"][st.session_state["active_conversation"]],
     )
     # map title back to id
-    st.session_state["active_conversation"] = conv_ids[conv_titles.index(selected_title)]
+    st.session_state["active_conversation"] = st.session_state["title_to_id"][selected_title]
 
 with cB:
     if st.button("➕ New", use_container_width=True):
@@ -271,6 +263,7 @@ with cB:
         n = len(st.session_state["conversations"]) + 1
         st.session_state["conversations"][new_id] = {"title": f"Conversation {n}", "chat": []}
         st.session_state["active_conversation"] = new_id
+        index_conversations()
         st.rerun()
 
 with cC:
@@ -299,17 +292,25 @@ if user_msg:
 
         answer_text = ""
         sources: List[Dict[str, Any]] = []
+        # Re-render the growing answer at most every RENDER_INTERVAL s / RENDER_EVERY_TOKENS tokens
+        last_render_ts = time.monotonic()
+        pending_tokens = 0
 
         # Stream assistant answer
         with st.chat_message("assistant"):
             answer_box = st.empty()
             with st.spinner("Streaming answer..."):
                 try:
-                    for evt in ask_stream(API_BASE, payload):
+                    for evt in ask_stream(API_BASE, payload, session=SESSION):
                         t = evt.get("type")
                         if t == "token":
                             answer_text += evt.get("data", "")
-                            answer_box.markdown(answer_text)
+                            pending_tokens += 1
+                            now = time.monotonic()
+                            if pending_tokens >= RENDER_EVERY_TOKENS or now - last_render_ts > RENDER_INTERVAL:
+                                answer_box.markdown(answer_text)
+                                last_render_ts = now
+                                pending_tokens = 0
                         elif t == "sources":
                             sources = evt.get("data", []) or []
                         elif t == "done":
@@ -317,8 +318,12 @@ if user_msg:
                 except Exception as e:
                     st.error(f"Streaming error: {e}")
 
+            # Final flush for whatever arrived since the last render
+            if pending_tokens:
+                answer_box.markdown(answer_text)
+
         # Store assistant message
-        st.session_state["chat"].append({"role": "assistant", "content": answer_text})
+        get_active_chat().append({"role": "assistant", "content": answer_text})
         st.session_state["last_answer"] = {"answer": answer_text, "sources": sources}
 
         # Render sources below the streamed answer